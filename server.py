@@ -1,87 +1,160 @@
 from __future__ import annotations
 
-import json
+import asyncio
+import bisect
 import time
+from collections import deque
 from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Dict, List, Set
+from typing import Awaitable, Callable, Deque, Dict, List, Sequence, Set, Tuple
 
+import orjson
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
+from sortedcontainers import SortedList
 
 ADMIN_PASSWORD = "admin"
 VOICE_CHANNELS = ["Voice 1", "Voice 2", "Voice 3", "Voice 4", "Radio Channel"]
+OUTBOX_LIMIT = 256
+STATE_FLUSH_DELAY = 0.020
+LOG_HISTORY_LIMIT = 500
+CLIENT_STRIPES = 16
+VOICE_SIGNAL_TYPES = {"voice_offer", "voice_answer", "voice_ice"}
+VOICE_SIGNAL_KEYS = {"type", "target", "data"}
+
+_CHAT_TEMPLATE = (
+    b'{"type":"chat","name":%b,"role":%b,"message":%b,"reply_to":%b,"timestamp":%b}'
+)
+_ENCRYPTED_CHAT_TEMPLATE = (
+    b'{"type":"chat","name":%b,"role":%b,"encrypted":true,"ciphertext":%b,"iv":%b,'
+    b'"reply_to":%b,"timestamp":%b}'
+)
 
 app = FastAPI(title="Cham Real-Time Lobby")
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 
+def _encode(payload: dict) -> bytes:
+    return orjson.dumps(payload)
+
+
+def _text(value: object) -> str:
+    return value.strip() if isinstance(value, str) else ""
+
+
+def _merge_objects(*objects: bytes) -> bytes:
+    return b"{" + b",".join(obj[1:-1] for obj in objects if len(obj) > 2) + b"}"
+
+
+def _nest(key: str, fragment: bytes) -> bytes:
+    return b"{" + orjson.dumps(key) + b":" + fragment + b"}"
+
+
 @dataclass
 class ClientSession:
     name: str
     role: str
     websocket: WebSocket
+    last_log_seq: int = 0
+    outbox: asyncio.Queue[bytes] = field(
+        default_factory=lambda: asyncio.Queue(maxsize=OUTBOX_LIMIT), repr=False
+    )
+    writer: asyncio.Task | None = field(default=None, repr=False)
+    name_json: bytes = field(init=False, repr=False)
+    role_json: bytes = field(init=False, repr=False)
 
+    def __post_init__(self) -> None:
+        self.name_json = orjson.dumps(self.name)
+        self.role_json = orjson.dumps(self.role)
 
-@dataclass
+
+@dataclass(slots=True, frozen=True)
 class Track:
     track_id: int
     title: str
     url: str
+    payload: dict = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        payload = {"track_id": self.track_id, "title": self.title, "url": self.url}
+        object.__setattr__(self, "payload", payload)
 
 
 @dataclass
 class MusicState:
-    queue: List[Track] = field(default_factory=list)
+    tracks: Dict[int, Track] = field(default_factory=dict)
     current_track_id: int | None = None
     is_playing: bool = False
     started_at: float | None = None
     position: float = 0.0
+    version: int = 0
+    _queue_payload: List[dict] = field(default_factory=list)
+
+    def mark_changed(self) -> None:
+        self.version += 1
+
+    def add_track(self, track: Track) -> None:
+        self.tracks[track.track_id] = track
+        self._queue_payload.append(track.payload)
+
+    def remove_track(self, track_id: int) -> None:
+        if self.tracks.pop(track_id, None) is None:
+            return
+        self._queue_payload = [track.payload for track in self.tracks.values()]
+
+    def has_track(self, track_id: int) -> bool:
+        return track_id in self.tracks
+
+    def first_track_id(self) -> int | None:
+        return next(iter(self.tracks), None)
 
     def sync_position(self, now: float) -> float:
         if self.is_playing and self.started_at is not None:
             return max(0.0, now - self.started_at)
         return max(0.0, self.position)
 
-    def to_payload(self, now: float) -> dict:
+    def state_payload(self) -> dict:
         return {
-            "queue": [track.__dict__ for track in self.queue],
+            "queue": self._queue_payload,
             "current_track_id": self.current_track_id,
             "is_playing": self.is_playing,
-            "position": self.sync_position(now),
-            "server_time": now,
         }
 
+    def clock_payload(self, now: float) -> dict:
+        return {"position": self.sync_position(now), "server_time": now}
+
 
 @dataclass
 class VoiceState:
-    channels: Dict[str, Set[str]] = field(
-        default_factory=lambda: {channel: set() for channel in VOICE_CHANNELS}
+    channels: Dict[str, SortedList] = field(
+        default_factory=lambda: {channel: SortedList() for channel in VOICE_CHANNELS}
     )
     user_channel: Dict[str, str] = field(default_factory=dict)
     talking: Dict[str, bool] = field(default_factory=dict)
+    version: int = 0
 
     def join_channel(self, name: str, channel: str) -> None:
         self.leave_channel(name)
         self.channels[channel].add(name)
         self.user_channel[name] = channel
+        self.version += 1
 
     def leave_channel(self, name: str) -> None:
         existing = self.user_channel.pop(name, None)
         if existing:
             self.channels[existing].discard(name)
-        self.talking.pop(name, None)
+        if self.talking.pop(name, None) is not None or existing:
+            self.version += 1
 
     def set_talking(self, name: str, is_talking: bool) -> None:
-        if name in self.user_channel:
+        if name in self.user_channel and self.talking.get(name) != is_talking:
             self.talking[name] = is_talking
+            self.version += 1
 
     def to_payload(self) -> dict:
         return {
-            "channels": {
-                channel: sorted(list(users)) for channel, users in self.channels.items()
-            },
+            "channels": {channel: list(users) for channel, users in self.channels.items()},
             "talking": self.talking,
         }
 
@@ -91,33 +164,87 @@ class VoiceState:
 
 @dataclass
 class LobbyState:
-    clients: Dict[str, ClientSession] = field(default_factory=dict)
-    logs: List[dict] = field(default_factory=list)
+    stripes: Tuple[Dict[str, ClientSession], ...] = field(
+        default_factory=lambda: tuple({} for _ in range(CLIENT_STRIPES))
+    )
+    logs: Deque[dict] = field(default_factory=lambda: deque(maxlen=LOG_HISTORY_LIMIT))
     music: MusicState = field(default_factory=MusicState)
     voice: VoiceState = field(default_factory=VoiceState)
+    users_version: int = 0
+    log_seq: int = 0
     _track_counter: int = 0
+    _sorted_keys: List[Tuple[str, str]] = field(default_factory=list)
+    _sorted_sessions: List[ClientSession] = field(default_factory=list)
+    _sessions_snapshot: Tuple[ClientSession, ...] = ()
+    _admin_snapshot: Tuple[ClientSession, ...] = ()
+    _member_snapshot: Tuple[ClientSession, ...] = ()
 
     def list_users(self) -> List[dict]:
         return [
             {"name": session.name, "role": session.role}
-            for session in sorted(self.clients.values(), key=lambda s: s.name.lower())
+            for session in self._sessions_snapshot
         ]
 
     def name_available(self, name: str) -> bool:
-        return name not in self.clients
-
-    def add_client(self, name: str, role: str, websocket: WebSocket) -> None:
-        self.clients[name] = ClientSession(name=name, role=role, websocket=websocket)
+        return name not in self._bucket(name)
+
+    def get_client(self, name: str) -> ClientSession | None:
+        return self._bucket(name).get(name)
+
+    def add_client(self, name: str, role: str, websocket: WebSocket) -> ClientSession:
+        assert self.name_available(name)
+        session = ClientSession(name=name, role=role, websocket=websocket)
+        self._bucket(name)[name] = session
+        key = (name.lower(), name)
+        index = bisect.bisect_left(self._sorted_keys, key)
+        self._sorted_keys.insert(index, key)
+        self._sorted_sessions.insert(index, session)
+        self._clients_changed()
+        return session
 
     def remove_client(self, name: str) -> None:
-        self.clients.pop(name, None)
+        if self._bucket(name).pop(name, None) is None:
+            return
+        index = bisect.bisect_left(self._sorted_keys, (name.lower(), name))
+        del self._sorted_keys[index]
+        del self._sorted_sessions[index]
+        self._clients_changed()
 
     def add_log(self, message: str) -> None:
-        entry = {"message": message, "timestamp": current_time_label()}
+        self.log_seq += 1
+        entry = {"seq": self.log_seq, "message": message, "timestamp": current_time_label()}
         self.logs.append(entry)
 
-    def list_admins(self) -> List[ClientSession]:
-        return [session for session in self.clients.values() if session.role == "admin"]
+    def logs_since(self, seq: int) -> List[dict]:
+        entries = []
+        for entry in reversed(self.logs):
+            if entry["seq"] <= seq:
+                break
+            entries.append(entry)
+        entries.reverse()
+        return entries
+
+    def list_sessions(self) -> Tuple[ClientSession, ...]:
+        return self._sessions_snapshot
+
+    def list_admins(self) -> Tuple[ClientSession, ...]:
+        return self._admin_snapshot
+
+    def list_members(self) -> Tuple[ClientSession, ...]:
+        return self._member_snapshot
+
+    def _bucket(self, name: str) -> Dict[str, ClientSession]:
+        return self.stripes[hash(name) % CLIENT_STRIPES]
+
+    def _clients_changed(self) -> None:
+        self.users_version += 1
+        self._sessions_snapshot = tuple(self._sorted_sessions)
+        self._admin_snapshot = tuple(
+            session for session in self._sessions_snapshot if session.role == "admin"
+        )
+        self._member_snapshot = tuple(
+            session for session in self._sessions_snapshot if session.role != "admin"
+        )
 
     def next_track_id(self) -> int:
         self._track_counter += 1
@@ -127,54 +254,193 @@ class LobbyState:
 class ConnectionManager:
     def __init__(self, state: LobbyState) -> None:
         self.state = state
+        self._fragments: Dict[str, Tuple[int, bytes]] = {}
+        self._dirty: Set[str] = set()
+        self._flush_task: asyncio.Task | None = None
+        self._closing: Set[asyncio.Task] = set()
 
     async def connect(self, websocket: WebSocket) -> None:
         await websocket.accept()
 
-    async def broadcast_users(self) -> None:
-        payload = {"type": "users", "users": self.state.list_users()}
-        await self._broadcast(payload)
+    def start_writer(self, session: ClientSession) -> None:
+        session.writer = asyncio.create_task(self._write_outbox(session))
+
+    def stop_writer(self, session: ClientSession) -> None:
+        if session.writer is not None:
+            session.writer.cancel()
+            session.writer = None
 
-    async def broadcast_chat(self, payload: dict) -> None:
-        await self._broadcast(payload)
+    def mark_dirty(self, *keys: str) -> None:
+        self._dirty.update(keys)
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_soon())
 
-    async def broadcast_logs(self) -> None:
-        payload = {"type": "logs", "logs": self.state.logs}
-        await self._broadcast_to_admins(payload)
+    async def broadcast_chat(self, message: bytes) -> None:
+        await self._broadcast_frame(message)
 
-    async def broadcast_music(self) -> None:
-        now = time.time()
-        payload = {"type": "music_state", **self.state.music.to_payload(now)}
-        await self._broadcast(payload)
+    async def broadcast_combined(self, keys: Set[str], extra: dict | None = None) -> None:
+        await self._broadcast_sections("lobby_event", keys, extra)
 
-    async def broadcast_voice(self) -> None:
-        payload = {"type": "voice_state", **self.state.voice.to_payload()}
-        await self._broadcast(payload)
+    def build_join_ack(self, role: str) -> bytes:
+        header = {"type": "join_ack", "success": True, "role": role}
+        parts = [_encode(header), _nest("users", self._users_json())]
+        if role == "admin":
+            parts.append(_nest("logs", self._logs_json()))
+            parts.append(_encode({"log_seq": self.state.log_seq}))
+        parts.append(self._music_json(time.time()))
+        parts.append(self._voice_json())
+        return _merge_objects(*parts)
 
     async def send_error(self, websocket: WebSocket, message: str) -> None:
         payload = {"type": "error", "message": message}
-        await websocket.send_text(json.dumps(payload))
-
-    async def send_direct(self, websocket: WebSocket, payload: dict) -> None:
-        await websocket.send_text(json.dumps(payload))
+        await websocket.send_bytes(_encode(payload))
+
+    def send_to(self, session: ClientSession, message: bytes) -> None:
+        try:
+            session.outbox.put_nowait(message)
+        except asyncio.QueueFull:
+            self._evict(session)
+
+    async def _flush_soon(self) -> None:
+        await asyncio.sleep(STATE_FLUSH_DELAY)
+        dirty, self._dirty = self._dirty, set()
+        self._flush_task = None
+        await self._broadcast_sections("state", dirty)
+
+    async def _broadcast_sections(
+        self, frame_type: str, keys: Set[str], extra: dict | None = None
+    ) -> None:
+        parts = self._state_parts(keys)
+        if extra:
+            parts.append(_encode(extra))
+        message = _merge_objects(_encode({"type": frame_type}), *parts)
+        if "logs" not in keys or not self.state.list_admins():
+            if parts:
+                await self._broadcast_frame(message)
+            return
+        # Logs are admin-only: admins get their delta merged into the same frame.
+        if parts:
+            self._enqueue_all(self.state.list_members(), message)
+        for sessions, delta in self._take_log_deltas():
+            if delta is not None:
+                admin_message = _merge_objects(message, _nest("logs_delta", delta))
+                self._enqueue_all(sessions, admin_message)
+            elif parts:
+                self._enqueue_all(sessions, message)
+
+    def _state_parts(self, keys: Set[str]) -> List[bytes]:
+        parts = []
+        if "users" in keys:
+            parts.append(_nest("users", self._users_json()))
+        if "music" in keys:
+            parts.append(_nest("music", self._music_json(time.time())))
+        if "voice" in keys:
+            parts.append(_nest("voice", self._voice_json()))
+        return parts
+
+    def _users_json(self) -> bytes:
+        return self._cached("users", self.state.users_version, self.state.list_users)
+
+    def _take_log_deltas(self) -> List[Tuple[List[ClientSession], bytes | None]]:
+        seq = self.state.log_seq
+        # Admins that have seen the same amount of history share one encoded delta.
+        groups: Dict[int, List[ClientSession]] = {}
+        for session in self.state.list_admins():
+            groups.setdefault(session.last_log_seq, []).append(session)
+            session.last_log_seq = seq
+        deltas: List[Tuple[List[ClientSession], bytes | None]] = []
+        for since, sessions in groups.items():
+            if since >= seq:
+                deltas.append((sessions, None))
+            else:
+                delta = {"entries": self.state.logs_since(since), "seq": seq}
+                deltas.append((sessions, _encode(delta)))
+        return deltas
+
+    def _logs_json(self) -> bytes:
+        return self._cached("logs", self.state.log_seq, lambda: list(self.state.logs))
+
+    def _voice_json(self) -> bytes:
+        return self._cached("voice", self.state.voice.version, self.state.voice.to_payload)
+
+    def _music_json(self, now: float) -> bytes:
+        music = self.state.music
+        static = self._cached("music", music.version, music.state_payload)
+        # Position and server time move with the clock, so only the rest of
+        # the payload can be reused between broadcasts.
+        return _merge_objects(static, _encode(music.clock_payload(now)))
+
+    def _cached(self, key: str, version: int, build: Callable[[], object]) -> bytes:
+        cached = self._fragments.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        fragment = orjson.dumps(build())
+        self._fragments[key] = (version, fragment)
+        return fragment
+
+    async def _broadcast_frame(self, message: bytes) -> None:
+        self._enqueue_all(self.state.list_sessions(), message)
+
+    def _enqueue_all(self, sessions: Sequence[ClientSession], message: bytes) -> None:
+        for session in sessions:
+            self.send_to(session, message)
+
+    async def _write_outbox(self, session: ClientSession) -> None:
+        try:
+            while True:
+                message = await session.outbox.get()
+                await session.websocket.send_bytes(message)
+        except Exception:
+            # The socket is broken: close it so the handler stops receiving
+            # and its finally block removes the session.
+            session.writer = None
+            self._close_later(session.websocket)
+
+    def _evict(self, session: ClientSession) -> None:
+        # The client cannot keep up with the lobby: stop queueing for it and
+        # close the socket so its handler runs the usual disconnect cleanup.
+        if session.writer is None:
+            return
+        self.stop_writer(session)
+        self._close_later(session.websocket)
 
-    async def _broadcast(self, payload: dict) -> None:
-        message = json.dumps(payload)
-        for session in list(self.state.clients.values()):
-            await session.websocket.send_text(message)
+    def _close_later(self, websocket: WebSocket) -> None:
+        task = asyncio.create_task(self._close_quietly(websocket))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
 
-    async def _broadcast_to_admins(self, payload: dict) -> None:
-        message = json.dumps(payload)
-        for session in list(self.state.list_admins()):
-            await session.websocket.send_text(message)
+    async def _close_quietly(self, websocket: WebSocket) -> None:
+        try:
+            await websocket.close(code=1013)
+        except Exception:
+            pass
 
 
 lobby_state = LobbyState()
 manager = ConnectionManager(lobby_state)
 
+Handler = Callable[[ClientSession, dict], Awaitable[None]]
+
+
+_time_label: Tuple[int, str, bytes] = (-1, "", b'""')
+
+
+def _refresh_time_label() -> Tuple[int, str, bytes]:
+    global _time_label
+    now = time.time()
+    minute = int(now // 60)
+    if minute != _time_label[0]:
+        label = datetime.fromtimestamp(now).strftime("%I:%M%p").lstrip("0")
+        _time_label = (minute, label, orjson.dumps(label))
+    return _time_label
+
 
 def current_time_label() -> str:
-    return datetime.now().strftime("%I:%M%p").lstrip("0")
+    return _refresh_time_label()[1]
+
+
+def current_time_label_json() -> bytes:
+    return _refresh_time_label()[2]
 
 
 @app.get("/")
@@ -187,7 +453,171 @@ def create_track(title: str, url: str) -> Track:
 
 
 def get_target_session(name: str) -> ClientSession | None:
-    return lobby_state.clients.get(name)
+    return lobby_state.get_client(name)
+
+
+async def handle_chat(session: ClientSession, payload: dict) -> None:
+    is_encrypted = bool(payload.get("encrypted", False))
+    reply_to = _text(payload.get("reply_to")) or None
+    if is_encrypted:
+        ciphertext = _text(payload.get("ciphertext"))
+        iv = _text(payload.get("iv"))
+        if not ciphertext or not iv:
+            return
+        message = _ENCRYPTED_CHAT_TEMPLATE % (
+            session.name_json,
+            session.role_json,
+            orjson.dumps(ciphertext),
+            orjson.dumps(iv),
+            orjson.dumps(reply_to),
+            current_time_label_json(),
+        )
+    else:
+        text = _text(payload.get("message"))
+        if not text:
+            return
+        message = _CHAT_TEMPLATE % (
+            session.name_json,
+            session.role_json,
+            orjson.dumps(text),
+            orjson.dumps(reply_to),
+            current_time_label_json(),
+        )
+    await manager.broadcast_chat(message)
+
+
+async def handle_voice_join(session: ClientSession, payload: dict) -> None:
+    channel = _text(payload.get("channel"))
+    if channel in VOICE_CHANNELS:
+        lobby_state.voice.join_channel(session.name, channel)
+        lobby_state.add_log(f"{session.name} joined {channel}.")
+        manager.mark_dirty("voice", "logs")
+
+
+async def handle_voice_leave(session: ClientSession, payload: dict) -> None:
+    lobby_state.voice.leave_channel(session.name)
+    lobby_state.add_log(f"{session.name} left voice channels.")
+    manager.mark_dirty("voice", "logs")
+
+
+async def handle_voice_talking(session: ClientSession, payload: dict) -> None:
+    is_talking = bool(payload.get("is_talking", False))
+    lobby_state.voice.set_talking(session.name, is_talking)
+    manager.mark_dirty("voice")
+
+
+async def relay_voice_signal(session: ClientSession, payload: dict, raw: str) -> None:
+    target_name = _text(payload.get("target"))
+    if not target_name or target_name == session.name:
+        return
+    if not lobby_state.voice.same_channel(session.name, target_name):
+        return
+    target_session = get_target_session(target_name)
+    if target_session:
+        if payload.keys() <= VOICE_SIGNAL_KEYS:
+            # The SDP/ICE blob is opaque to the server, so a well-formed frame
+            # is forwarded as-is with "from" appended instead of re-encoded.
+            forward = raw.encode().rstrip()[:-1] + b',"from":' + session.name_json + b"}"
+        else:
+            forward = _encode(
+                {"type": payload["type"], "from": session.name, "data": payload.get("data")}
+            )
+        manager.send_to(target_session, forward)
+
+
+async def handle_music_add(session: ClientSession, payload: dict) -> None:
+    url = _text(payload.get("url"))
+    title = _text(payload.get("title")) or "Untitled track"
+    if not url:
+        return
+    music = lobby_state.music
+    track = create_track(title, url)
+    music.add_track(track)
+    music.mark_changed()
+    lobby_state.add_log(f"{session.name} added track: {title}.")
+    if music.current_track_id is None:
+        music.current_track_id = track.track_id
+    manager.mark_dirty("music", "logs")
+
+
+async def handle_music_delete(session: ClientSession, payload: dict) -> None:
+    track_id = int(payload.get("track_id", 0))
+    music = lobby_state.music
+    music.remove_track(track_id)
+    if music.current_track_id == track_id:
+        music.current_track_id = music.first_track_id()
+        music.is_playing = False
+        music.position = 0.0
+        music.started_at = None
+    music.mark_changed()
+    lobby_state.add_log(f"{session.name} removed a track from the playlist.")
+    manager.mark_dirty("music", "logs")
+
+
+async def handle_music_select(session: ClientSession, payload: dict) -> None:
+    track_id = int(payload.get("track_id", 0))
+    music = lobby_state.music
+    if music.has_track(track_id):
+        music.current_track_id = track_id
+        music.is_playing = False
+        music.position = 0.0
+        music.started_at = None
+        music.mark_changed()
+        lobby_state.add_log(f"{session.name} selected a new track.")
+        manager.mark_dirty("music", "logs")
+
+
+async def handle_music_play(session: ClientSession, payload: dict) -> None:
+    music = lobby_state.music
+    if music.current_track_id is None or music.is_playing:
+        return
+    now = time.time()
+    music.is_playing = True
+    music.started_at = now - music.position
+    music.mark_changed()
+    lobby_state.add_log(f"{session.name} started playback.")
+    manager.mark_dirty("music", "logs")
+
+
+async def handle_music_pause(session: ClientSession, payload: dict) -> None:
+    music = lobby_state.music
+    if not music.is_playing:
+        return
+    now = time.time()
+    music.position = music.sync_position(now)
+    music.is_playing = False
+    music.started_at = None
+    music.mark_changed()
+    lobby_state.add_log(f"{session.name} paused playback.")
+    manager.mark_dirty("music", "logs")
+
+
+async def handle_music_seek(session: ClientSession, payload: dict) -> None:
+    music = lobby_state.music
+    now = time.time()
+    new_position = float(payload.get("position", 0.0))
+    music.position = max(0.0, new_position)
+    if music.is_playing:
+        music.started_at = now - music.position
+    music.mark_changed()
+    lobby_state.add_log(f"{session.name} scrubbed the timeline.")
+    manager.mark_dirty("music", "logs")
+
+
+USER_HANDLERS: Dict[str, Handler] = {
+    "chat": handle_chat,
+    "voice_join": handle_voice_join,
+    "voice_leave": handle_voice_leave,
+    "voice_talking": handle_voice_talking,
+}
+ADMIN_HANDLERS: Dict[str, Handler] = {
+    "music_add": handle_music_add,
+    "music_delete": handle_music_delete,
+    "music_select": handle_music_select,
+    "music_play": handle_music_play,
+    "music_pause": handle_music_pause,
+    "music_seek": handle_music_seek,
+}
 
 
 @app.websocket("/ws")
@@ -195,14 +625,15 @@ async def websocket_endpoint(websocket: WebSocket) -> None:
     await manager.connect(websocket)
     name: str | None = None
     role: str | None = None
+    session: ClientSession | None = None
     try:
         join_text = await websocket.receive_text()
-        join_payload = json.loads(join_text)
+        join_payload = orjson.loads(join_text)
         if join_payload.get("type") != "join":
             await manager.send_error(websocket, "Expected join message first.")
             return
-        proposed_name = str(join_payload.get("name", "")).strip()
-        proposed_role = str(join_payload.get("role", "user")).strip().lower()
+        proposed_name = _text(join_payload.get("name"))
+        proposed_role = _text(join_payload.get("role", "user")).lower()
         if not proposed_name:
             await manager.send_error(websocket, "Name cannot be empty.")
             return
@@ -210,7 +641,7 @@ async def websocket_endpoint(websocket: WebSocket) -> None:
             await manager.send_error(websocket, "Role must be user or admin.")
             return
         if proposed_role == "admin":
-            password = str(join_payload.get("password", "")).strip()
+            password = _text(join_payload.get("password"))
             if password != ADMIN_PASSWORD:
                 await manager.send_error(websocket, "Invalid admin password.")
                 return
@@ -220,195 +651,53 @@ async def websocket_endpoint(websocket: WebSocket) -> None:
 
         name = proposed_name
         role = proposed_role
-        lobby_state.add_client(name, role, websocket)
+        session = lobby_state.add_client(name, role, websocket)
         lobby_state.add_log(f"{name} connected as {role}.")
-        await manager.send_direct(
-            websocket,
-            {
-                "type": "join_ack",
-                "success": True,
-                "role": role,
-                "users": lobby_state.list_users(),
-                "logs": lobby_state.logs,
-                **lobby_state.music.to_payload(time.time()),
-                **lobby_state.voice.to_payload(),
+        session.last_log_seq = lobby_state.log_seq
+        manager.start_writer(session)
+        manager.send_to(session, manager.build_join_ack(role))
+        await manager.broadcast_combined(
+            {"users", "logs", "voice"},
+            extra={
+                "chat": {
+                    "type": "chat",
+                    "name": "System",
+                    "role": "system",
+                    "message": f"{name} joined as {role}.",
+                    "timestamp": current_time_label(),
+                }
             },
         )
-        await manager.broadcast_users()
-        await manager.broadcast_logs()
-        await manager.broadcast_music()
-        await manager.broadcast_voice()
-        await manager.broadcast_chat(
-            {
-                "type": "chat",
-                "name": "System",
-                "role": "system",
-                "message": f"{name} joined as {role}.",
-                "timestamp": current_time_label(),
-            }
-        )
 
         while True:
             message_text = await websocket.receive_text()
-            payload = json.loads(message_text)
+            payload = orjson.loads(message_text)
             message_type = payload.get("type")
-            if message_type == "chat":
-                is_encrypted = bool(payload.get("encrypted", False))
-                reply_to = str(payload.get("reply_to", "")).strip() or None
-                if is_encrypted:
-                    ciphertext = str(payload.get("ciphertext", "")).strip()
-                    iv = str(payload.get("iv", "")).strip()
-                    if not ciphertext or not iv:
-                        continue
-                    await manager.broadcast_chat(
-                        {
-                            "type": "chat",
-                            "name": name,
-                            "role": role,
-                            "encrypted": True,
-                            "ciphertext": ciphertext,
-                            "iv": iv,
-                            "reply_to": reply_to,
-                            "timestamp": current_time_label(),
-                        }
-                    )
-                else:
-                    text = str(payload.get("message", "")).strip()
-                    if not text:
-                        continue
-                    await manager.broadcast_chat(
-                        {
-                            "type": "chat",
-                            "name": name,
-                            "role": role,
-                            "message": text,
-                            "reply_to": reply_to,
-                            "timestamp": current_time_label(),
-                        }
-                    )
-                continue
-            if message_type == "voice_join":
-                channel = str(payload.get("channel", "")).strip()
-                if channel in VOICE_CHANNELS:
-                    lobby_state.voice.join_channel(name, channel)
-                    lobby_state.add_log(f"{name} joined {channel}.")
-                    await manager.broadcast_voice()
-                    await manager.broadcast_logs()
-                continue
-            if message_type == "voice_leave":
-                lobby_state.voice.leave_channel(name)
-                lobby_state.add_log(f"{name} left voice channels.")
-                await manager.broadcast_voice()
-                await manager.broadcast_logs()
-                continue
-            if message_type == "voice_talking":
-                is_talking = bool(payload.get("is_talking", False))
-                lobby_state.voice.set_talking(name, is_talking)
-                await manager.broadcast_voice()
-                continue
-            if message_type in {"voice_offer", "voice_answer", "voice_ice"}:
-                target_name = str(payload.get("target", "")).strip()
-                if target_name and target_name != name:
-                    if lobby_state.voice.same_channel(name, target_name):
-                        target_session = get_target_session(target_name)
-                        if target_session:
-                            forward = {
-                                "type": message_type,
-                                "from": name,
-                                "data": payload.get("data"),
-                            }
-                            await manager.send_direct(target_session.websocket, forward)
-                continue
-            if role != "admin":
-                continue
-            if message_type == "music_add":
-                url = str(payload.get("url", "")).strip()
-                title = str(payload.get("title", "")).strip() or "Untitled track"
-                if not url:
-                    continue
-                track = create_track(title, url)
-                lobby_state.music.queue.append(track)
-                lobby_state.add_log(f"{name} added track: {title}.")
-                if lobby_state.music.current_track_id is None:
-                    lobby_state.music.current_track_id = track.track_id
-                await manager.broadcast_music()
-                await manager.broadcast_logs()
-                continue
-            if message_type == "music_delete":
-                track_id = int(payload.get("track_id", 0))
-                lobby_state.music.queue = [
-                    track for track in lobby_state.music.queue if track.track_id != track_id
-                ]
-                if lobby_state.music.current_track_id == track_id:
-                    lobby_state.music.current_track_id = (
-                        lobby_state.music.queue[0].track_id
-                        if lobby_state.music.queue
-                        else None
-                    )
-                    lobby_state.music.is_playing = False
-                    lobby_state.music.position = 0.0
-                    lobby_state.music.started_at = None
-                lobby_state.add_log(f"{name} removed a track from the playlist.")
-                await manager.broadcast_music()
-                await manager.broadcast_logs()
+            if message_type in VOICE_SIGNAL_TYPES:
+                await relay_voice_signal(session, payload, message_text)
                 continue
-            if message_type == "music_select":
-                track_id = int(payload.get("track_id", 0))
-                if any(track.track_id == track_id for track in lobby_state.music.queue):
-                    lobby_state.music.current_track_id = track_id
-                    lobby_state.music.is_playing = False
-                    lobby_state.music.position = 0.0
-                    lobby_state.music.started_at = None
-                    lobby_state.add_log(f"{name} selected a new track.")
-                    await manager.broadcast_music()
-                    await manager.broadcast_logs()
-                continue
-            if message_type == "music_play":
-                if lobby_state.music.current_track_id is None or lobby_state.music.is_playing:
-                    continue
-                now = time.time()
-                lobby_state.music.is_playing = True
-                lobby_state.music.started_at = now - lobby_state.music.position
-                lobby_state.add_log(f"{name} started playback.")
-                await manager.broadcast_music()
-                await manager.broadcast_logs()
-                continue
-            if message_type == "music_pause":
-                if not lobby_state.music.is_playing:
-                    continue
-                now = time.time()
-                lobby_state.music.position = lobby_state.music.sync_position(now)
-                lobby_state.music.is_playing = False
-                lobby_state.music.started_at = None
-                lobby_state.add_log(f"{name} paused playback.")
-                await manager.broadcast_music()
-                await manager.broadcast_logs()
-                continue
-            if message_type == "music_seek":
-                now = time.time()
-                new_position = float(payload.get("position", 0.0))
-                lobby_state.music.position = max(0.0, new_position)
-                if lobby_state.music.is_playing:
-                    lobby_state.music.started_at = now - lobby_state.music.position
-                lobby_state.add_log(f"{name} scrubbed the timeline.")
-                await manager.broadcast_music()
-                await manager.broadcast_logs()
+            handler = USER_HANDLERS.get(message_type)
+            if handler is None and role == "admin":
+                handler = ADMIN_HANDLERS.get(message_type)
+            if handler is not None:
+                await handler(session, payload)
     except WebSocketDisconnect:
         pass
     finally:
-        if name:
+        if session is not None:
             lobby_state.remove_client(name)
+            manager.stop_writer(session)
             lobby_state.voice.leave_channel(name)
             lobby_state.add_log(f"{name} disconnected.")
-            await manager.broadcast_users()
-            await manager.broadcast_voice()
-            await manager.broadcast_logs()
-            await manager.broadcast_chat(
-                {
-                    "type": "chat",
-                    "name": "System",
-                    "role": "system",
-                    "message": f"{name} left the lobby.",
-                    "timestamp": current_time_label(),
-                }
+            await manager.broadcast_combined(
+                {"users", "logs", "voice"},
+                extra={
+                    "chat": {
+                        "type": "chat",
+                        "name": "System",
+                        "role": "system",
+                        "message": f"{name} left the lobby.",
+                        "timestamp": current_time_label(),
+                    }
+                },
             )